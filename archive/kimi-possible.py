@@ -8,6 +8,7 @@ from pathlib import Path
 from textwrap import dedent
 from typing import List, Dict, Any, Optional
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from rich.console import Console
@@ -16,8 +17,26 @@ from rich.panel import Panel
 from rich.style import Style
 from prompt_toolkit import PromptSession
 from prompt_toolkit.styles import Style as PromptStyle
+import re
+import mmap
+import atexit
+import shutil
+import tempfile
+import sqlite3
+import fnmatch
 import time
+import random
+import statistics
+import threading
+import hashlib
+import functools
+import multiprocessing
+import difflib
 import requests
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, TimeoutError as FutureTimeoutError, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # Initialize Rich console and prompt session
 console = Console()
@@ -33,18 +52,36 @@ prompt_session = PromptSession(
 # 1. Configure OpenAI client for Kimi via OpenRouter
 # --------------------------------------------------------------------------------
 load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+EXA_BASE_URL = "https://api.exa.ai"
+XAI_SEARCH_URL = "https://api.x.ai/v1/search"
+
+# Clients are built in main() so --replay can supply placeholder keys first
+client: Optional[OpenAI] = None
+exa_client = None
 
-# Add Exa client
 try:
     from exa_py import Exa
-    exa_client = Exa(api_key=os.getenv("EXA_API_KEY"))
 except ImportError:
     console.print("[bold yellow]⚠[/bold yellow] 'exa_py' not found. To enable web search, please run: [bright_cyan]pip install exa-py[/bright_cyan]")
-    exa_client = None
+    Exa = None
+
+def configure_clients(stand_in_url: Optional[str] = None):
+    """Build the OpenRouter and Exa clients, optionally routed through the record/replay stand-in server."""
+    global client, exa_client
+    client = OpenAI(
+        base_url=f"{stand_in_url}/openrouter/api/v1" if stand_in_url else OPENROUTER_BASE_URL,
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+    )
+    if Exa is not None:
+        exa_client = Exa(api_key=os.getenv("EXA_API_KEY"), base_url=f"{stand_in_url}/exa" if stand_in_url else EXA_BASE_URL)
+
+# Optional inotify support for cheap change detection on files in context
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
 
 # --------------------------------------------------------------------------------
 # 2. Define our schema using Pydantic for type safety
@@ -97,6 +134,47 @@ tools = [
             },
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "grep_files",
+            "description": "Search files under a directory for a regex or literal pattern and return only the matching lines with a few lines of context. Prefer this over reading whole files when looking for a symbol or string.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "The regular expression (or literal text when literal is true) to search for",
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": "Directory or file to search (default: current directory)",
+                    },
+                    "literal": {
+                        "type": "boolean",
+                        "description": "Treat the pattern as literal text instead of a regex (default: false)",
+                    },
+                    "case_sensitive": {
+                        "type": "boolean",
+                        "description": "Match case exactly (default: true)",
+                    },
+                    "file_glob": {
+                        "type": "string",
+                        "description": "Only search files whose name matches this glob, e.g. '*.py'",
+                    },
+                    "context_lines": {
+                        "type": "integer",
+                        "description": "Lines of context before and after each match (0-10, default 2)",
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "Maximum number of matches to return (1-500, default 50)",
+                    }
+                },
+                "required": ["pattern"]
+            },
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -172,16 +250,24 @@ tools = [
         "type": "function",
         "function": {
             "name": "exa_search",
-            "description": "Perform a web search using Exa.ai for recent and relevant information.",
+            "description": "Perform web searches using Exa.ai for recent and relevant information. Pass several queries at once to cover different angles in a single call; they run concurrently and results are merged and de-duplicated by URL.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "The search query to find information on the web.",
+                    "queries": {
+                        "type": "array",
+                        "description": "The search queries to run (up to 8).",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "query": {"type": "string", "description": "The search query to find information on the web."},
+                                "num_results": {"type": "integer", "description": "Number of results for this query (1-10, default 3)."}
+                            },
+                            "required": ["query"]
+                        }
                     }
                 },
-                "required": ["query"]
+                "required": ["queries"]
             },
         }
     },
@@ -189,16 +275,49 @@ tools = [
         "type": "function",
         "function": {
             "name": "live_search",
-            "description": "Perform a live search on X (formerly Twitter) using x.ai's Live Search API.",
+            "description": "Perform live searches on X (formerly Twitter) using x.ai's Live Search API. Pass several queries at once; they run concurrently and results are merged and de-duplicated by URL.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "query": {
+                    "queries": {
+                        "type": "array",
+                        "description": "The search queries to run (up to 8).",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "query": {"type": "string", "description": "The search query."},
+                                "num_results": {"type": "integer", "description": "Number of results for this query (1-10, default 3)."}
+                            },
+                            "required": ["query"]
+                        }
+                    }
+                },
+                "required": ["queries"]
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch_result",
+            "description": "Read part of a large tool result that was truncated in the conversation, using the handle given in the truncation notice.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {
                         "type": "string",
-                        "description": "The search query."
+                        "description": "The result handle from the truncation notice",
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Character offset to start reading from (default 0)",
+                    },
+                    "length": {
+                        "type": "integer",
+                        "description": "Number of characters to read (default 4000, max 20000)",
                     }
                 },
-                "required": ["query"]
+                "required": ["handle"]
             },
         }
     }
@@ -217,6 +336,8 @@ def get_system_prompt(domain: str = "general", research_targets: List[str] = Non
     1. Code Analysis & File Operations:
        - read_file: Read a single file's content
        - read_multiple_files: Read multiple files at once
+       - grep_files: Search a directory for a pattern and get matching lines with context
+       - fetch_result: Page through a large tool result that was truncated
        - create_file: Create or overwrite a single file
        - create_multiple_files: Create multiple files at once
        - edit_file: Make precise edits to existing files using snippet replacement
@@ -228,7 +349,10 @@ def get_system_prompt(domain: str = "general", research_targets: List[str] = Non
     TOOL SELECTION RULES:
     - For X.com/Twitter content → live_search
     - For all other web research → exa_search
+    - Batch related searches into one call by passing several queries together
     - For file operations → appropriate file tools
+    - To locate a symbol or string in a codebase → grep_files before reading whole files
+    - When a tool result is truncated → fetch_result with its handle, only for the parts you need
     - Always read files before editing them
     """)
     
@@ -299,9 +423,10 @@ def get_system_prompt(domain: str = "general", research_targets: List[str] = Non
 
 # Configuration class for domain settings
 class KimiConfig:
-    def __init__(self, domain: str = "general", research_targets: List[str] = None):
+    def __init__(self, domain: str = "general", research_targets: List[str] = None, fan_out: bool = False):
         self.domain = domain
         self.research_targets = research_targets or []
+        self.fan_out = fan_out  # Research each target with its own sub-agent, then merge
         self.system_prompt = get_system_prompt(domain, research_targets)
 
 def parse_args():
@@ -323,7 +448,65 @@ def parse_args():
         type=str,
         help="Path to JSON config file with domain settings"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--fan-out",
+        action="store_true",
+        help="Research each target with its own concurrent sub-agent and merge their findings"
+    )
+    parser.add_argument(
+        "--fan-out-concurrency",
+        type=int,
+        default=FAN_OUT_CONCURRENCY,
+        help=f"Maximum number of research sub-agents running at once (default: {FAN_OUT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for each completion to finish instead of streaming it and starting read-only tools early"
+    )
+    parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record every completion and search HTTP exchange to a cassette file"
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Serve completions and searches from a recorded cassette instead of the network"
+    )
+    parser.add_argument(
+        "--replay-latency",
+        default="none",
+        help="Latency injected on replay: none, recorded, or synthetic:MEAN_MS[:JITTER_MS] (default: none)"
+    )
+    parser.add_argument(
+        "--replay-seed",
+        type=int,
+        default=0,
+        help="Random seed for synthetic replay latency (default: 0)"
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=os.path.join(Path.home(), ".cache", "kimi-possible", "completions.sqlite3"),
+        metavar="PATH",
+        help="Cache completions on disk keyed on the full request (default path: ~/.cache/kimi-possible/completions.sqlite3)"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=200,
+        help="Maximum completion cache size in MB before least-recently-used entries are evicted (default: 200)"
+    )
+    parser.add_argument(
+        "--bench",
+        metavar="PROMPTS_FILE",
+        help="Run the prompts in this file (one per line) non-interactively and report turn time and tokens"
+    )
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    return args
 
 def load_config_from_file(config_path: str) -> KimiConfig:
     """Load configuration from JSON file."""
@@ -333,8 +516,9 @@ def load_config_from_file(config_path: str) -> KimiConfig:
         
         domain = config_data.get('domain', 'general')
         research_targets = config_data.get('research_targets', [])
+        fan_out = bool(config_data.get('fan_out', False))
         
-        return KimiConfig(domain, research_targets)
+        return KimiConfig(domain, research_targets, fan_out)
     except Exception as e:
         console.print(f"[bold red]Error loading config file: {e}[/bold red]")
         return KimiConfig()  # Return default config
@@ -424,61 +608,68 @@ def try_handle_add_command(user_input: str) -> bool:
                 add_directory_to_conversation(normalized_path)
             else:
                 # Handle a single file as before
+                if context_tracker.is_tracked(normalized_path):
+                    if context_tracker.refresh([normalized_path]):
+                        console.print(f"[bold magenta]✓[/bold magenta] File '[bright_cyan]{normalized_path}[/bright_cyan]' refreshed in context.\n")
+                    else:
+                        console.print(f"[dim]File '{normalized_path}' is already in context and unchanged.[/dim]\n")
+                    return True
                 content = read_local_file(normalized_path)
-                conversation_history.append({
-                    "role": "system",
-                    "content": f"Content of file '{normalized_path}':\n\n{content}"
-                })
+                add_file_to_context(normalized_path, content)
                 console.print(f"[bold magenta]✓[/bold magenta] File '[bright_cyan]{normalized_path}[/bright_cyan]' added to context.\n")
         except OSError as e:
             console.print(f"[bold red]✗[/bold red] Cannot access path '[bright_cyan]{path_to_add}[/bright_cyan]': {e}\n")
         return True
     return False
 
+# Files, directories and extensions skipped when scanning a folder (/add and grep_files)
+EXCLUDED_FILES = {
+    # Python specific
+    ".DS_Store", "Thumbs.db", ".gitignore", ".python-version",
+    "uv.lock", ".uv", "uvenv", ".uvenv", ".venv", "venv",
+    "__pycache__", ".pytest_cache", ".coverage", ".mypy_cache",
+    # Node.js / Web specific
+    "node_modules", "package-lock.json", "yarn.lock", "pnpm-lock.yaml",
+    ".next", ".nuxt", "dist", "build", ".cache", ".parcel-cache",
+    ".turbo", ".vercel", ".output", ".contentlayer",
+    # Build outputs
+    "out", "coverage", ".nyc_output", "storybook-static",
+    # Environment and config
+    ".env", ".env.local", ".env.development", ".env.production",
+    # Misc
+    ".git", ".svn", ".hg", "CVS"
+}
+EXCLUDED_EXTENSIONS = {
+    # Binary and media files
+    ".png", ".jpg", ".jpeg", ".gif", ".ico", ".svg", ".webp", ".avif",
+    ".mp4", ".webm", ".mov", ".mp3", ".wav", ".ogg",
+    ".zip", ".tar", ".gz", ".7z", ".rar",
+    ".exe", ".dll", ".so", ".dylib", ".bin",
+    # Documents
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+    # Python specific
+    ".pyc", ".pyo", ".pyd", ".egg", ".whl",
+    # UV specific
+    ".uv", ".uvenv",
+    # Database and logs
+    ".db", ".sqlite", ".sqlite3", ".log",
+    # IDE specific
+    ".idea", ".vscode",
+    # Web specific
+    ".map", ".chunk.js", ".chunk.css",
+    ".min.js", ".min.css", ".bundle.js", ".bundle.css",
+    # Cache and temp files
+    ".cache", ".tmp", ".temp",
+    # Font files
+    ".ttf", ".otf", ".woff", ".woff2", ".eot"
+}
+
 def add_directory_to_conversation(directory_path: str):
     with console.status("[bold bright_magenta]📁 Scanning directory...[/bold bright_magenta]") as status:
-        excluded_files = {
-            # Python specific
-            ".DS_Store", "Thumbs.db", ".gitignore", ".python-version",
-            "uv.lock", ".uv", "uvenv", ".uvenv", ".venv", "venv",
-            "__pycache__", ".pytest_cache", ".coverage", ".mypy_cache",
-            # Node.js / Web specific
-            "node_modules", "package-lock.json", "yarn.lock", "pnpm-lock.yaml",
-            ".next", ".nuxt", "dist", "build", ".cache", ".parcel-cache",
-            ".turbo", ".vercel", ".output", ".contentlayer",
-            # Build outputs
-            "out", "coverage", ".nyc_output", "storybook-static",
-            # Environment and config
-            ".env", ".env.local", ".env.development", ".env.production",
-            # Misc
-            ".git", ".svn", ".hg", "CVS"
-        }
-        excluded_extensions = {
-            # Binary and media files
-            ".png", ".jpg", ".jpeg", ".gif", ".ico", ".svg", ".webp", ".avif",
-            ".mp4", ".webm", ".mov", ".mp3", ".wav", ".ogg",
-            ".zip", ".tar", ".gz", ".7z", ".rar",
-            ".exe", ".dll", ".so", ".dylib", ".bin",
-            # Documents
-            ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
-            # Python specific
-            ".pyc", ".pyo", ".pyd", ".egg", ".whl",
-            # UV specific
-            ".uv", ".uvenv",
-            # Database and logs
-            ".db", ".sqlite", ".sqlite3", ".log",
-            # IDE specific
-            ".idea", ".vscode",
-            # Web specific
-            ".map", ".chunk.js", ".chunk.css",
-            ".min.js", ".min.css", ".bundle.js", ".bundle.css",
-            # Cache and temp files
-            ".cache", ".tmp", ".temp",
-            # Font files
-            ".ttf", ".otf", ".woff", ".woff2", ".eot"
-        }
         skipped_files = []
         added_files = []
+        refreshed_files = []
+        unchanged_files = []
         total_files_processed = 0
         max_files = 1000  # Reasonable limit for files to process
         max_file_size = 5_000_000  # 5MB limit
@@ -490,18 +681,18 @@ def add_directory_to_conversation(directory_path: str):
 
             status.update(f"[bold bright_magenta]📁 Processing {root}...[/bold bright_magenta]")
             # Skip hidden directories and excluded directories
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in excluded_files]
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in EXCLUDED_FILES]
 
             for file in files:
                 if total_files_processed >= max_files:
                     break
 
-                if file.startswith('.') or file in excluded_files:
+                if file.startswith('.') or file in EXCLUDED_FILES:
                     skipped_files.append(os.path.join(root, file))
                     continue
 
                 _, ext = os.path.splitext(file)
-                if ext.lower() in excluded_extensions:
+                if ext.lower() in EXCLUDED_EXTENSIONS:
                     skipped_files.append(os.path.join(root, file))
                     continue
 
@@ -519,11 +710,16 @@ def add_directory_to_conversation(directory_path: str):
                         continue
 
                     normalized_path = normalize_path(full_path)
+                    if context_tracker.is_tracked(normalized_path):
+                        # Already in context: only resend it if it changed on disk
+                        if context_tracker.refresh([normalized_path]):
+                            refreshed_files.append(normalized_path)
+                        else:
+                            unchanged_files.append(normalized_path)
+                        total_files_processed += 1
+                        continue
                     content = read_local_file(normalized_path)
-                    conversation_history.append({
-                        "role": "system",
-                        "content": f"Content of file '{normalized_path}':\n\n{content}"
-                    })
+                    add_file_to_context(normalized_path, content)
                     added_files.append(normalized_path)
                     total_files_processed += 1
 
@@ -535,6 +731,12 @@ def add_directory_to_conversation(directory_path: str):
             console.print(f"\n[bold bright_magenta]📁 Added files:[/bold bright_magenta] [dim]({len(added_files)} of {total_files_processed})[/dim]")
             for f in added_files:
                 console.print(f"  [bright_cyan]📄 {f}[/bright_cyan]")
+        if refreshed_files:
+            console.print(f"\n[bold bright_magenta]🔄 Refreshed files:[/bold bright_magenta] [dim]({len(refreshed_files)})[/dim]")
+            for f in refreshed_files:
+                console.print(f"  [bright_cyan]📄 {f}[/bright_cyan]")
+        if unchanged_files:
+            console.print(f"\n[dim]{len(unchanged_files)} file(s) already in context and unchanged.[/dim]")
         if skipped_files:
             console.print(f"\n[bold yellow]⏭ Skipped files:[/bold yellow] [dim]({len(skipped_files)})[/dim]")
             for f in skipped_files[:10]:  # Show only first 10 to avoid clutter
@@ -556,15 +758,17 @@ def is_binary_file(file_path: str, peek_size: int = 1024) -> bool:
         return True
 
 def ensure_file_in_context(file_path: str) -> bool:
+    """Check the file is readable and queue it for context if it is not there yet.
+
+    This runs inside a tool call, so nothing is appended to the history here: a message
+    between the assistant's tool_calls and their results is rejected by the API.
+    Queued and changed files are picked up by refresh_context_files() before the next completion.
+    """
     try:
         normalized_path = normalize_path(file_path)
-        content = read_local_file(normalized_path)
-        file_marker = f"Content of file '{normalized_path}'"
-        if not any(file_marker in msg["content"] for msg in conversation_history):
-            conversation_history.append({
-                "role": "system",
-                "content": f"{file_marker}:\n\n{content}"
-            })
+        read_local_file(normalized_path)
+        if not context_tracker.is_tracked(normalized_path):
+            context_tracker.request(normalized_path)
         return True
     except OSError:
         console.print(f"[bold red]✗[/bold red] Could not read file '[bright_cyan]{file_path}[/bright_cyan]' for editing context")
@@ -589,23 +793,404 @@ def initialize_conversation():
     conversation_history = [
         {"role": "system", "content": kimi_config.system_prompt}
     ]
+    context_tracker.reset()
+    compactor.reset()
+    seen_content.reset()
+    search_hit_cache.clear()
+    spill_store.reset()
 
 conversation_history = []
 
+# --------------------------------------------------------------------------------
+# 5.1. Context file tracking
+# --------------------------------------------------------------------------------
+
+class TrackedFile:
+    def __init__(self, path: str, content: str, message: Dict[str, Any]):
+        self.path = path
+        self.content = content  # The version held in message; diffs are always taken against it
+        self.message = message  # The history message holding the full content
+        self.status_message: Optional[Dict[str, Any]] = None  # Latest diff or refresh note, at most one
+        self.digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.mtime_ns, self.size = self._stat()
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+class ContextFileTracker:
+    """Track files added to the conversation and resend only what changed on disk.
+
+    Change detection is a stat comparison (mtime + size) per tracked file. When
+    inotify is available, only files the kernel reported as touched are stat'ed.
+    A stat hit is confirmed with a content hash before anything is resent.
+    """
+
+    max_diff_ratio = 0.5  # Send a replacement when the diff is larger than this fraction of the file
+    inotify_mask = 0
+
+    def __init__(self):
+        self.files: Dict[str, TrackedFile] = {}
+        self.inotify = None
+        self.watch_dirs: Dict[int, str] = {}
+        self.dirty_paths = set()
+        self.requested: List[str] = []
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                # Watch directories rather than files so editors that save via rename are caught
+                self.inotify_mask = (inotify_flags.MODIFY | inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO |
+                                     inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM)
+            except OSError:
+                self.inotify = None
+
+    def reset(self):
+        self.files.clear()
+        self.dirty_paths.clear()
+        self.requested.clear()
+        if self.inotify is not None:
+            for wd in list(self.watch_dirs):
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    pass
+        self.watch_dirs.clear()
+
+    def is_tracked(self, path: str) -> bool:
+        return path in self.files
+
+    def request(self, path: str):
+        """Queue a file to be added to context by the next refresh_context_files()."""
+        if path not in self.requested:
+            self.requested.append(path)
+
+    def take_requested(self) -> List[str]:
+        requested, self.requested = self.requested, []
+        return [path for path in requested if path not in self.files]
+
+    def track(self, path: str, content: str, message: Dict[str, Any]):
+        self.files[path] = TrackedFile(path, content, message)
+        self._watch(os.path.dirname(path))
+
+    def _watch(self, directory: str):
+        if self.inotify is None or directory in self.watch_dirs.values():
+            return
+        try:
+            wd = self.inotify.add_watch(directory, self.inotify_mask)
+            self.watch_dirs[wd] = directory
+        except OSError:
+            # Out of watches or unsupported filesystem: fall back to stat polling
+            self.inotify = None
+            self.watch_dirs.clear()
+
+    def _candidates(self) -> List[str]:
+        """Return the tracked paths that may have changed since the last check."""
+        if self.inotify is None:
+            return list(self.files)
+        try:
+            events = self.inotify.read(timeout=0)
+        except OSError:
+            return list(self.files)
+        for event in events:
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                return list(self.files)
+            directory = self.watch_dirs.get(event.wd)
+            if directory is not None:
+                self.dirty_paths.add(os.path.join(directory, event.name))
+        candidates = [p for p in self.dirty_paths if p in self.files]
+        self.dirty_paths.clear()
+        return candidates
+
+    def refresh(self, paths: Optional[List[str]] = None) -> List[str]:
+        """Push changes for tracked files into conversation_history; return the changed paths."""
+        changed = []
+        for path in (paths if paths is not None else self._candidates()):
+            tracked = self.files.get(path)
+            if tracked is None:
+                continue
+            try:
+                stat = tracked._stat()
+            except OSError:
+                self._drop(tracked)
+                changed.append(path)
+                continue
+            if stat == (tracked.mtime_ns, tracked.size):
+                continue
+            try:
+                content = read_local_file(path)
+            except (OSError, UnicodeDecodeError):
+                # Remember the stat so an unreadable file is not re-read before every completion
+                tracked.mtime_ns, tracked.size = stat
+                continue
+            tracked.mtime_ns, tracked.size = stat
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if digest == tracked.digest:
+                continue  # Touched but not modified
+            self._update(tracked, content, digest)
+            changed.append(path)
+        return changed
+
+    def _update(self, tracked: TrackedFile, content: str, digest: str):
+        # Diff against the full copy in context so a file never carries more than one diff message
+        diff = "".join(difflib.unified_diff(
+            tracked.content.splitlines(keepends=True),
+            content.splitlines(keepends=True),
+            fromfile=f"a/{os.path.basename(tracked.path)}",
+            tofile=f"b/{os.path.basename(tracked.path)}",
+        ))
+        if not diff:
+            # Back to the version in context: the previous diff no longer applies
+            self._set_status(tracked, None)
+        elif len(diff) <= len(content) * self.max_diff_ratio:
+            self._set_status(tracked, f"File '{tracked.path}' changed on disk. Unified diff against its content shown above:\n\n{diff}")
+        else:
+            # Replace the stale copy in place so the file never appears twice
+            if not self._replace_message(tracked.message, f"Content of file '{tracked.path}':\n\n{content}"):
+                tracked.message = {"role": "system", "content": f"Content of file '{tracked.path}':\n\n{content}"}
+                conversation_history.append(tracked.message)
+            tracked.content = content
+            self._set_status(tracked, f"File '{tracked.path}' changed on disk; its content in context has been replaced with the current version.")
+        tracked.digest = digest
+
+    def _set_status(self, tracked: TrackedFile, content: Optional[str]):
+        """Swap the file's previous diff or refresh note for a new one appended at the end."""
+        if tracked.status_message is not None:
+            self._remove_messages([tracked.status_message])
+            tracked.status_message = None
+        if content is not None:
+            tracked.status_message = {"role": "system", "content": content}
+            conversation_history.append(tracked.status_message)
+
+    def _drop(self, tracked: TrackedFile):
+        del self.files[tracked.path]
+        self._remove_messages([tracked.message] + ([tracked.status_message] if tracked.status_message else []))
+        conversation_history.append({
+            "role": "system",
+            "content": f"File '{tracked.path}' no longer exists on disk and was removed from context."
+        })
+
+    @staticmethod
+    def _replace_message(message: Dict[str, Any], content: str) -> bool:
+        if any(msg is message for msg in conversation_history):
+            message["content"] = content
+            return True
+        return False
+
+    @staticmethod
+    def _remove_messages(messages: List[Dict[str, Any]]):
+        ids = {id(m) for m in messages}
+        conversation_history[:] = [msg for msg in conversation_history if id(msg) not in ids]
+
+context_tracker = ContextFileTracker()
+
+def add_file_to_context(normalized_path: str, content: str):
+    """Append a file's full content to the conversation and start tracking it for changes."""
+    message = {
+        "role": "system",
+        "content": f"Content of file '{normalized_path}':\n\n{content}"
+    }
+    conversation_history.append(message)
+    context_tracker.track(normalized_path, content, message)
+
+def refresh_context_files():
+    """Add queued files and resend files in context that were modified since the last completion."""
+    for path in context_tracker.take_requested():
+        try:
+            add_file_to_context(path, read_local_file(path))
+        except (OSError, UnicodeDecodeError):
+            continue
+        console.print(f"[dim]📎 Added '{path}' to context[/dim]")
+    changed = context_tracker.refresh()
+    for path in changed:
+        console.print(f"[dim]🔄 Refreshed '{path}' in context (changed on disk)[/dim]")
+
 # --------------------------------------------------------------------------------
 # 6. Tool execution functions
 # --------------------------------------------------------------------------------
 
+class ToolTimeout(Exception):
+    pass
+
+class ToolCancelled(Exception):
+    pass
+
+class ToolSpec:
+    """Execution policy for a tool: deadline, retries, cacheability, side effects and result spilling."""
+
+    def __init__(self, name: str, handler, timeout: float = 30.0, retries: int = 0, retry_backoff: float = 1.0,
+                 cacheable: bool = False, side_effect_free: bool = False, spill: bool = True):
+        self.name = name
+        self.handler = handler
+        self.timeout = timeout  # Calls that change state are only checked against it before they start
+        self.retries = retries if side_effect_free else 0  # Never replay calls that change state
+        self.retry_backoff = retry_backoff
+        self.cacheable = cacheable  # Results may be reused within the session; the handler keeps its own cache
+        self.side_effect_free = side_effect_free
+        self.spill = spill  # Oversized results go to spill_store and are paged with fetch_result
+
+# Register each tool with its execution policy
+tool_registry = {spec.name: spec for spec in [
+    ToolSpec("read_file", lambda args: execute_read_file(args), timeout=10, side_effect_free=True),
+    ToolSpec("read_multiple_files", lambda args: execute_read_multiple_files(args), timeout=30, side_effect_free=True),
+    ToolSpec("grep_files", lambda args: execute_grep_files(args), timeout=30, side_effect_free=True),
+    ToolSpec("create_file", lambda args: execute_create_file(args), timeout=10),
+    ToolSpec("create_multiple_files", lambda args: execute_create_multiple_files(args), timeout=30),
+    ToolSpec("edit_file", lambda args: execute_edit_file(args), timeout=10),
+    # Exa caches raw hits per query (search_hit_cache) so repeats are still de-duplicated;
+    # live search is real-time, so it always goes to the API
+    ToolSpec("exa_search", lambda args: execute_exa_search(args), timeout=45, retries=1,
+             cacheable=True, side_effect_free=True),
+    ToolSpec("live_search", lambda args: execute_live_search(args), timeout=45, retries=1, side_effect_free=True),
+    ToolSpec("fetch_result", lambda args: execute_fetch_result(args), timeout=10, side_effect_free=True, spill=False),
+]}
+
 # Map each tool name to its corresponding function
-tool_map = {
-    "read_file": lambda args: execute_read_file(args),
-    "read_multiple_files": lambda args: execute_read_multiple_files(args),
-    "create_file": lambda args: execute_create_file(args),
-    "create_multiple_files": lambda args: execute_create_multiple_files(args),
-    "edit_file": lambda args: execute_edit_file(args),
-    "exa_search": lambda args: execute_exa_search(args),
-    "live_search": lambda args: execute_live_search(args),
-}
+tool_map = {name: spec.handler for name, spec in tool_registry.items()}
+
+# Wall-clock budget for a whole user turn (completions plus tool calls)
+TURN_TIME_BUDGET = 300.0
+
+_tool_context = threading.local()
+
+def tool_time_remaining(default: float = 30.0) -> float:
+    """Seconds left for the tool call running on this thread; use it for network timeouts."""
+    deadline = getattr(_tool_context, "deadline", None)
+    if deadline is None:
+        return default
+    return max(deadline - time.monotonic(), 0.1)
+
+def check_tool_cancelled():
+    """Raise ToolCancelled if the tool call running on this thread was abandoned."""
+    cancel_event = getattr(_tool_context, "cancel_event", None)
+    if cancel_event is not None and cancel_event.is_set():
+        raise ToolCancelled("Tool call was cancelled")
+
+def _run_with_deadline(spec: ToolSpec, arguments: Dict[str, Any], deadline: float, cancel_event: threading.Event,
+                       seen: Optional["SeenContentIndex"] = None) -> str:
+    """Run a tool handler on a daemon thread and wait for it until the deadline.
+
+    Calls that change state are waited for to the end: abandoning one would report a
+    timeout while it may still write, and the model would retry against a moving file.
+    """
+    future = Future()
+
+    def worker():
+        _tool_context.deadline = deadline
+        _tool_context.cancel_event = cancel_event
+        _tool_context.seen_content = seen
+        try:
+            future.set_result(spec.handler(arguments))
+        except BaseException as e:
+            future.set_exception(e)
+
+    started = time.monotonic()
+    threading.Thread(target=worker, name=f"tool-{spec.name}", daemon=True).start()
+    try:
+        return future.result(timeout=max(deadline - started, 0) if spec.side_effect_free else None)
+    except FutureTimeoutError:
+        # The worker cannot be killed; flag it so cooperative handlers stop early
+        cancel_event.set()
+        raise ToolTimeout(f"{spec.name} timed out after {time.monotonic() - started:.1f}s")
+    except KeyboardInterrupt:
+        cancel_event.set()
+        raise
+
+def run_tool(name: str, arguments: Dict[str, Any], turn_deadline: Optional[float] = None,
+             seen: Optional["SeenContentIndex"] = None) -> str:
+    """Execute a tool under its registry policy; raises ToolTimeout or the handler's error.
+
+    seen overrides the session's seen-content index for callers with their own context (sub-agents).
+    """
+    spec = tool_registry[name]
+    attempt = 0
+    while True:
+        deadline = time.monotonic() + spec.timeout
+        if turn_deadline is not None:
+            if turn_deadline - time.monotonic() <= 0:
+                raise ToolTimeout("Turn time budget exhausted before the tool could run")
+            deadline = min(deadline, turn_deadline)
+        try:
+            result = _run_with_deadline(spec, arguments, deadline, threading.Event(), seen)
+            break
+        except (ToolTimeout, ToolCancelled, KeyboardInterrupt):
+            # A timed-out call is still running on its thread; report it rather than piling on another attempt
+            raise
+        except Exception as e:
+            if attempt >= spec.retries:
+                raise
+            attempt += 1
+            console.print(f"[dim]Retrying {name} after error ({attempt}/{spec.retries}): {e}[/dim]")
+            time.sleep(spec.retry_backoff * attempt)
+
+    return spill_store.maybe_spill(name, result) if spec.spill else result
+
+class SpillStore:
+    """Session store for tool results too large to inline in the conversation.
+
+    Only a head preview and a handle go into the history; the model pages
+    through the rest with fetch_result.
+    """
+
+    threshold = 12_000       # Characters above which a result is spilled
+    preview_chars = 2_000
+    default_page = 4_000
+    max_page = 20_000
+
+    def __init__(self):
+        self.directory: Optional[str] = None
+        self.counter = 0
+        self.lock = threading.Lock()
+        self.sizes: Dict[str, int] = {}
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    def maybe_spill(self, tool_name: str, result: Any) -> Any:
+        if not isinstance(result, str) or len(result) <= self.threshold:
+            return result
+        with self.lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="kimi-spill-")
+                atexit.register(shutil.rmtree, self.directory, True)
+            self.counter += 1
+            handle = f"{tool_name}-{self.counter}"
+        with open(self._path(handle), "w", encoding="utf-8") as f:
+            f.write(result)
+        self.sizes[handle] = len(result)
+        # Cut the preview at a line boundary when one is reasonably close
+        cut = result.rfind("\n", 0, self.preview_chars)
+        preview = result[:cut if cut > self.preview_chars // 2 else self.preview_chars]
+        return (f"{preview}\n\n[Result truncated: showing {len(preview)} of {len(result)} characters. "
+                f"Call fetch_result with handle '{handle}' and an offset to read more "
+                f"(up to {self.max_page} characters per call).]")
+
+    def read(self, handle: str, offset: int, length: int) -> str:
+        if handle not in self.sizes:
+            raise KeyError(f"Unknown result handle '{handle}'")
+        with open(self._path(handle), "r", encoding="utf-8") as f:
+            return f.read()[offset:offset + length]
+
+    def reset(self):
+        with self.lock:
+            for handle in self.sizes:
+                try:
+                    os.remove(self._path(handle))
+                except OSError:
+                    pass
+            self.sizes.clear()
+            self.counter = 0
+
+spill_store = SpillStore()
+
+def execute_fetch_result(arguments: Dict[str, Any]) -> str:
+    handle = arguments["handle"]
+    offset = max(int(arguments.get("offset", 0)), 0)
+    length = max(1, min(int(arguments.get("length", SpillStore.default_page)), SpillStore.max_page))
+    chunk = spill_store.read(handle, offset, length)
+    total = spill_store.sizes[handle]
+    end = offset + len(chunk)
+    footer = f"\n\n[More available: call fetch_result with offset {end}.]" if end < total else "\n\n[End of result.]"
+    return f"Characters {offset}-{end} of {total} from '{handle}':\n\n{chunk}{footer}"
 
 def execute_read_file(arguments: Dict[str, Any]) -> str:
     file_path = arguments["file_path"]
@@ -617,6 +1202,7 @@ def execute_read_multiple_files(arguments: Dict[str, Any]) -> str:
     file_paths = arguments["file_paths"]
     results = []
     for file_path in file_paths:
+        check_tool_cancelled()
         try:
             normalized_path = normalize_path(file_path)
             content = read_local_file(normalized_path)
@@ -625,6 +1211,194 @@ def execute_read_multiple_files(arguments: Dict[str, Any]) -> str:
             results.append(f"Error reading '{file_path}': {e}")
     return "\n\n" + "="*50 + "\n\n".join(results)
 
+GREP_MAX_FILES = 5000
+GREP_MAX_MATCHES_PER_FILE = 20
+GREP_MAX_LINE_LENGTH = 300
+GREP_PROCESS_MIN_FILES = 200  # Below this, starting worker processes costs more than they save
+
+# re holds the GIL while it scans, so large trees are scanned in forked worker processes
+try:
+    _grep_mp_context = multiprocessing.get_context("fork")
+except ValueError:
+    _grep_mp_context = None  # No fork (Windows): workers would re-run this script on start, so scan serially
+
+def iter_grep_files(root_path: str, file_glob: Optional[str] = None):
+    """Yield searchable files under root_path using the same exclusion rules as /add."""
+    if os.path.isfile(root_path):
+        yield root_path
+        return
+    for root, dirs, files in os.walk(root_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in EXCLUDED_FILES)
+        for file in sorted(files):
+            if file.startswith('.') or file in EXCLUDED_FILES:
+                continue
+            if os.path.splitext(file)[1].lower() in EXCLUDED_EXTENSIONS:
+                continue
+            if file_glob and not fnmatch.fnmatch(file, file_glob):
+                continue
+            yield os.path.join(root, file)
+
+def anchor_crlf(pattern: str) -> str:
+    """Let an unescaped `$` also match before the \\r of a CRLF line ending."""
+    out, i, in_class = [], 0, False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            if char == "]":
+                in_class = False
+        elif char == "[":
+            in_class = True
+            # A leading ']' (after an optional '^') is a literal member of the class
+            j = i + 1
+            if pattern[j:j + 1] == "^":
+                j += 1
+            if pattern[j:j + 1] == "]":
+                j += 1
+            out.append(pattern[i:j])
+            i = j
+            continue
+        elif char == "$":
+            char = r"(?=\r?$)"
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+def grep_file(path: str, regex, context_lines: int, max_matches: int) -> List[List[tuple]]:
+    """Return match groups for one file; each group is a list of (line_number, is_match, text)."""
+    try:
+        size = os.path.getsize(path)
+        if size == 0 or size > 5_000_000 or is_binary_file(path):
+            return []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # Search the mapped bytes directly; only the lines around hits are decoded
+            match_lines = []
+            line_number, position = 1, 0
+            for match in regex.finditer(data):
+                line_number += data[position:match.start()].count(b"\n")
+                position = match.start()
+                if not match_lines or match_lines[-1] != line_number:
+                    match_lines.append(line_number)
+                    if len(match_lines) >= max_matches:
+                        break
+            if not match_lines:
+                return []
+
+            wanted = set()
+            for number in match_lines:
+                wanted.update(range(max(number - context_lines, 1), number + context_lines + 1))
+            texts = {}
+            line_start, number, last_wanted = 0, 1, max(wanted)
+            while number <= last_wanted and line_start < len(data):
+                line_end = data.find(b"\n", line_start)
+                if line_end == -1:
+                    line_end = len(data)
+                if number in wanted:
+                    text = data[line_start:line_end].decode("utf-8", errors="replace").rstrip("\r")
+                    if len(text) > GREP_MAX_LINE_LENGTH:
+                        text = text[:GREP_MAX_LINE_LENGTH] + "…"
+                    texts[number] = text
+                line_start, number = line_end + 1, number + 1
+    except (OSError, ValueError):
+        return []
+
+    # Merge overlapping context windows into contiguous groups
+    groups: List[List[tuple]] = []
+    matched = set(match_lines)
+    previous = None
+    for number in sorted(texts):
+        if previous is None or number != previous + 1:
+            groups.append([])
+        groups[-1].append((number, number in matched, texts[number]))
+        previous = number
+    return groups
+
+def execute_grep_files(arguments: Dict[str, Any]) -> str:
+    pattern = arguments["pattern"]
+    root_path = normalize_path(arguments.get("path") or ".")
+    if not os.path.exists(root_path):
+        return f"Error: Path '{root_path}' does not exist"
+    context_lines = max(0, min(int(arguments.get("context_lines", 2)), 10))
+    max_results = max(1, min(int(arguments.get("max_results", 50)), 500))
+    flags = 0 if arguments.get("case_sensitive", True) else re.IGNORECASE
+    # re.MULTILINE's `$` only matches before \n, so anchored patterns would miss CRLF files
+    raw = re.escape(pattern) if arguments.get("literal") else anchor_crlf(pattern)
+    try:
+        regex = re.compile(raw.encode("utf-8"), flags | re.MULTILINE)
+    except re.error as e:
+        return f"Error: Invalid regular expression '{pattern}': {e}"
+
+    console.print(f"[bright_magenta]🔎 Grepping for:[/bright_magenta] [dim]{pattern}[/dim] [dim]in {root_path}[/dim]")
+    paths = []
+    for path in iter_grep_files(root_path, arguments.get("file_glob")):
+        paths.append(path)
+        if len(paths) >= GREP_MAX_FILES:
+            break
+
+    results = []
+    total_matches = 0
+    truncated = len(paths) >= GREP_MAX_FILES
+    per_file = min(GREP_MAX_MATCHES_PER_FILE, max_results)
+    capped = False
+    scan = functools.partial(grep_file, regex=regex, context_lines=context_lines, max_matches=per_file)
+    executor = None
+    if _grep_mp_context is not None and len(paths) >= GREP_PROCESS_MIN_FILES and (os.cpu_count() or 1) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(8, os.cpu_count()), mp_context=_grep_mp_context)
+    # Results are collected in path order whether the files were scanned here or in the workers
+    try:
+        for batch_start in range(0, len(paths), 64):
+            check_tool_cancelled()
+            batch = paths[batch_start:batch_start + 64]
+            scanned = None
+            if executor is not None:
+                try:
+                    scanned = list(executor.map(scan, batch))
+                except (OSError, BrokenProcessPool):
+                    executor.shutdown(wait=False)
+                    executor = None  # Workers could not start here: carry on in this thread
+            if scanned is None:
+                scanned = [scan(path) for path in batch]
+            for path, groups in zip(batch, scanned):
+                if not groups:
+                    continue
+                if sum(1 for group in groups for _, is_match, _ in group if is_match) >= per_file:
+                    truncated = True  # Hit the per-file cap; the file may have more matches
+                kept = []
+                for group in groups:
+                    group_matches = sum(1 for _, is_match, _ in group if is_match)
+                    if total_matches + group_matches > max_results:
+                        capped = True
+                        break
+                    total_matches += group_matches
+                    kept.append(group)
+                if kept:
+                    results.append((path, kept))
+                if capped:
+                    break
+            if capped:
+                truncated = True
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    if not results:
+        return f"No matches for '{pattern}' in '{root_path}' ({len(paths)} files searched)"
+    output = f"Matches for '{pattern}' in '{root_path}' ({total_matches} matching lines in {len(results)} files"
+    output += ", truncated)" if truncated else ")"
+    output += ":\n"
+    for path, groups in results:
+        output += f"\n{path}\n"
+        for i, group in enumerate(groups):
+            if i:
+                output += "  --\n"
+            for number, is_match, text in group:
+                output += f"  {number}{':' if is_match else '-'} {text}\n"
+    return output
+
 def execute_create_file(arguments: Dict[str, Any]) -> str:
     file_path = arguments["file_path"]
     content = arguments["content"]
@@ -651,26 +1425,241 @@ def execute_edit_file(arguments: Dict[str, Any]) -> str:
     apply_diff_edit(file_path, original_snippet, new_snippet)
     return f"Successfully edited file '{file_path}'"
 
+class SeenContentIndex:
+    """Session-wide index of search hits already shown to the model.
+
+    Hits are matched on canonical URL first, then on a 64-bit SimHash of the
+    text so syndicated copies under other URLs are caught too. Repeats are
+    replaced by a back-reference to the result block where they first appeared.
+    """
+
+    tracking_params = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "ref_url", "igshid"}
+    host_tracking_params = {"x.com": {"s", "t"}}  # Share-sheet markers on X links
+    host_aliases = {"twitter.com": "x.com", "mobile.twitter.com": "x.com"}
+    simhash_max_distance = 3
+    simhash_min_words = 20
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.result_counter = 0
+        self.by_url: Dict[str, Dict[str, Any]] = {}
+        self.bands: Dict[tuple, List[Dict[str, Any]]] = {}
+
+    def next_result_id(self) -> int:
+        with self.lock:
+            self.result_counter += 1
+            return self.result_counter
+
+    @classmethod
+    def canonicalize_url(cls, url: Optional[str]) -> Optional[str]:
+        """Return a canonical http(s) URL, or None when url is not one and cannot be matched."""
+        if not url:
+            return None
+        try:
+            parts = urlsplit(url.strip())
+        except ValueError:
+            return None
+        if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+            return None
+        host = parts.netloc.lower()
+        for prefix in ("www.", "m.", "mobile.", "amp."):
+            if host.startswith(prefix) and host.count(".") > 1:
+                host = host[len(prefix):]
+        host = cls.host_aliases.get(host, host)
+        dropped = cls.tracking_params | cls.host_tracking_params.get(host, set())
+        query = sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_") and k.lower() not in dropped
+        )
+        path = parts.path.rstrip("/") or "/"
+        if path.endswith("/amp"):
+            path = path[:-len("/amp")] or "/"
+        return urlunsplit(("https", host, path, urlencode(query), ""))
+
+    @classmethod
+    def simhash(cls, text: str) -> Optional[int]:
+        words = re.findall(r"\w+", (text or "").lower())
+        if len(words) < cls.simhash_min_words:
+            return None  # Too short to fingerprint without false positives
+        weights = [0] * 64
+        for i in range(len(words) - 2):
+            shingle = " ".join(words[i:i + 3]).encode("utf-8")
+            h = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big")
+            for bit in range(64):
+                weights[bit] += 1 if h >> bit & 1 else -1
+        return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+    @staticmethod
+    def _bands(fingerprint: int) -> List[tuple]:
+        # Within distance 3, at least one of the four 16-bit bands must match exactly
+        return [(band, fingerprint >> (16 * band) & 0xFFFF) for band in range(4)]
+
+    def check(self, hit: Dict[str, Any], ref: str, result_id: int) -> Optional[Dict[str, Any]]:
+        """Return the first-seen entry if hit is a repeat, otherwise record it and return None."""
+        canonical = self.canonicalize_url(hit.get("url"))
+        fingerprint = self.simhash(hit.get("text") or "")
+        with self.lock:
+            if canonical and canonical in self.by_url:
+                return self.by_url[canonical]
+            if fingerprint is not None:
+                for key in self._bands(fingerprint):
+                    for entry in self.bands.get(key, []):
+                        if bin(entry["simhash"] ^ fingerprint).count("1") <= self.simhash_max_distance:
+                            return entry
+            entry = {"title": hit.get("title"), "url": hit.get("url"), "ref": ref,
+                     "result_id": result_id, "simhash": fingerprint}
+            if canonical:
+                self.by_url[canonical] = entry
+            if fingerprint is not None:
+                for key in self._bands(fingerprint):
+                    self.bands.setdefault(key, []).append(entry)
+            return None
+
+    def forget_results(self, text: str):
+        """Drop entries first shown in result blocks that are no longer in context."""
+        # Only result headers count; back-references inside a block point at blocks that may still be in context
+        result_ids = {int(n) for n in re.findall(r"^[\w ]+ results #(\d+) for ", text, re.MULTILINE)}
+        if not result_ids:
+            return
+        with self.lock:
+            self.by_url = {k: e for k, e in self.by_url.items() if e["result_id"] not in result_ids}
+            self.bands = {k: [e for e in entries if e["result_id"] not in result_ids] for k, entries in self.bands.items()}
+
+seen_content = SeenContentIndex()
+
+# Raw hits per (search, query, num_results); repeats still go through seen_content
+search_hit_cache: Dict[tuple, List[Dict[str, Any]]] = {}
+search_hit_cache_lock = threading.Lock()
+SEARCH_HIT_CACHE_SIZE = 256  # Oldest queries are dropped past this many
+
+def cache_search_hits(key: tuple, hits: List[Dict[str, Any]]):
+    with search_hit_cache_lock:
+        search_hit_cache.pop(key, None)
+        search_hit_cache[key] = hits
+        while len(search_hit_cache) > SEARCH_HIT_CACHE_SIZE:
+            del search_hit_cache[next(iter(search_hit_cache))]
+
+MAX_SEARCH_QUERIES = 8
+DEFAULT_NUM_RESULTS = 3
+MAX_NUM_RESULTS = 10
+
+def parse_search_queries(arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Normalize search arguments to a list of {query, num_results}, accepting the legacy single 'query'."""
+    raw = arguments.get("queries")
+    if raw is None:
+        raw = [{"query": arguments["query"], "num_results": arguments.get("num_results")}]
+    queries = []
+    seen = set()
+    for item in raw:
+        if isinstance(item, str):
+            item = {"query": item}
+        query = str(item.get("query", "")).strip()
+        if not query or query.lower() in seen:
+            continue
+        seen.add(query.lower())
+        num_results = item.get("num_results") or DEFAULT_NUM_RESULTS
+        queries.append({"query": query, "num_results": max(1, min(int(num_results), MAX_NUM_RESULTS))})
+    if not queries:
+        raise ValueError("At least one non-empty query is required")
+    return queries[:MAX_SEARCH_QUERIES]
+
+def run_search_queries(label: str, queries: List[Dict[str, Any]], search_one, empty_message: Optional[str] = None,
+                       cacheable: bool = True) -> str:
+    """Run search_one(query, num_results, timeout) for every query concurrently and merge the hits by URL.
+
+    search_one returns a list of {"title", "url", "text"} dicts or raises.
+    """
+    deadline = time.monotonic() + tool_time_remaining()
+    executor = ThreadPoolExecutor(max_workers=min(len(queries), 4), thread_name_prefix="kimi-search")
+    futures = []
+    for q in queries:
+        with search_hit_cache_lock:
+            cached = search_hit_cache.get((label, q["query"], q["num_results"])) if cacheable else None
+        if cached is not None:
+            futures.append(cached)
+        else:
+            futures.append(executor.submit(search_one, q["query"], q["num_results"], max(deadline - time.monotonic(), 0.1)))
+    merged: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    try:
+        for q, future in zip(queries, futures):
+            cache_key = (label, q["query"], q["num_results"])
+            try:
+                if isinstance(future, list):
+                    hits = future  # Cached hits
+                else:
+                    hits = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    if cacheable:
+                        cache_search_hits(cache_key, hits)
+            except FutureTimeoutError:
+                errors.append((q["query"], requests.exceptions.Timeout("timed out")))
+                continue
+            except Exception as e:
+                errors.append((q["query"], e))
+                continue
+            for hit in hits:
+                # Hits without a usable URL cannot be matched reliably, so each one is kept on its own
+                key = SeenContentIndex.canonicalize_url(hit["url"]) or f"no-url:{len(merged)}"
+                if key in merged:
+                    merged[key]["queries"].append(q["query"])
+                else:
+                    merged[key] = dict(hit, queries=[q["query"]])
+    finally:
+        executor.shutdown(wait=False)
+
+    if errors and len(errors) == len(queries):
+        transient = [e for _, e in errors if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))]
+        if transient:
+            raise transient[0]  # Transient: let the dispatcher retry it
+        return f"Error performing {label}: " + "; ".join(f"'{q}': {e}" for q, e in errors)
+
+    if not merged and not errors and empty_message:
+        return empty_message
+
+    # Sub-agents pass their own index so back-references only point into their own context
+    seen = getattr(_tool_context, "seen_content", None) or seen_content
+    result_id = seen.next_result_id()
+    query_list = ", ".join(f"'{q['query']}'" for q in queries)
+    header = f"{label} results #{result_id}"
+    formatted_results = f"{header} for {query_list} ({len(merged)} unique):\n\n"
+    for hit in merged.values():
+        formatted_results += f"Title: {hit['title']}\n"
+        formatted_results += f"URL: {hit['url'] or 'N/A'}\n"
+        if len(queries) > 1:
+            formatted_results += f"Matched queries: {'; '.join(hit['queries'])}\n"
+        first_seen = seen.check(hit, header, result_id)
+        if first_seen is None:
+            formatted_results += f"Content: {hit['text']}\n"
+        else:
+            formatted_results += f"Content: [duplicate of '{first_seen['title']}' <{first_seen['url']}> already shown in {first_seen['ref']}]\n"
+        formatted_results += "-"*20 + "\n"
+    for query, e in errors:
+        formatted_results += f"Error for query '{query}': {e}\n"
+    return formatted_results
+
 def execute_exa_search(arguments: Dict[str, Any]) -> str:
     if not exa_client:
         return "Error: Exa client is not configured. Please install exa-py and set EXA_API_KEY."
-    query = arguments["query"]
-    try:
-        console.print(f"[bright_magenta]🔍 Searching for:[/bright_magenta] [dim]{query}[/dim]")
+    queries = parse_search_queries(arguments)
+
+    def search_one(query: str, num_results: int, timeout: float) -> List[Dict[str, Any]]:
         search_results = exa_client.search_and_contents(
             query,
             use_autoprompt=True,
-            num_results=3,
+            num_results=num_results,
             text={"include_html_tags": False}
         )
-        # Format the results for the LLM
-        formatted_results = f"Search results for '{query}':\n\n"
-        for result in search_results.results:
-            formatted_results += f"Title: {result.title}\n"
-            formatted_results += f"URL: {result.url}\n"
-            formatted_results += f"Content: {result.text}\n"
-            formatted_results += "-"*20 + "\n"
-        return formatted_results
+        return [{"title": r.title, "url": r.url, "text": r.text} for r in search_results.results]
+
+    for q in queries:
+        console.print(f"[bright_magenta]🔍 Searching for:[/bright_magenta] [dim]{q['query']}[/dim]")
+    try:
+        return run_search_queries("Search", queries, search_one, cacheable=tool_registry["exa_search"].cacheable)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        raise  # Transient: let the dispatcher retry it
     except Exception as e:
         return f"Error performing Exa search: {e}"
 
@@ -684,35 +1673,32 @@ def execute_live_search(arguments: Dict[str, Any]) -> str:
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
-    
-    payload = {
-        "query": arguments["query"],
-        "data_sources": ["x"],  # Restrict results to Twitter only
-        "search_depth": "advanced"
-    }
+    queries = parse_search_queries(arguments)
 
+    def search_one(query: str, num_results: int, timeout: float) -> List[Dict[str, Any]]:
+        payload = {
+            "query": query,
+            "data_sources": ["x"],  # Restrict results to Twitter only
+            "search_depth": "advanced"
+        }
+        response = requests.post(XAI_SEARCH_URL, headers=headers, json=payload, timeout=timeout)
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise requests.exceptions.HTTPError(f"HTTP {e.response.status_code} - {e.response.text}", response=e.response)
+        results = response.json().get("results") or []
+        return [
+            {"title": r.get("title", "N/A"), "url": r.get("url") or None, "text": r.get("snippet", "N/A")}
+            for r in results[:num_results]
+        ]
+
+    for q in queries:
+        console.print(f"[bright_magenta]🔍 Performing X.ai Live Search for:[/bright_magenta] [dim]{q['query']}[/dim]")
     try:
-        console.print(f"[bright_magenta]🔍 Performing X.ai Live Search for:[/bright_magenta] [dim]{arguments['query']}[/dim]")
-        response = requests.post("https://api.x.ai/v1/search", headers=headers, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        formatted_results = f"Live search results for '{arguments['query']}':\n\n"
-        if not data.get("results"):
-            return "No results found from Live Search."
-
-        for result in data["results"]:
-            formatted_results += f"Title: {result.get('title', 'N/A')}\n"
-            formatted_results += f"URL: {result.get('url', 'N/A')}\n"
-            formatted_results += f"Snippet: {result.get('snippet', 'N/A')}\n\n"
-        
-        return formatted_results.strip()
-
-    except requests.exceptions.HTTPError as e:
-        return f"Error performing live search: HTTP {e.response.status_code} - {e.response.text}"
-    except requests.exceptions.RequestException as e:
-        return f"Error performing live search: {e}"
+        return run_search_queries("Live search", queries, search_one, "No results found from Live Search.",
+                                  cacheable=tool_registry["live_search"].cacheable).strip()
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        raise  # Transient: let the dispatcher retry it
     except Exception as e:
         return f"An unexpected error occurred during live search: {e}"
 
@@ -720,24 +1706,429 @@ def execute_live_search(arguments: Dict[str, Any]) -> str:
 # 7. Kimi API interaction (adapted from tool calling example)
 # --------------------------------------------------------------------------------
 
+def message_field(msg: Any, key: str, default: Any = None) -> Any:
+    """Read a field from a history entry, which may be a dict or an API message object."""
+    if isinstance(msg, dict):
+        return msg.get(key, default)
+    return getattr(msg, key, default)
+
+class ConversationCompactor:
+    """Fold turns evicted from the history window into a running summary message.
+
+    Summaries are built in a background thread while the current turn is being
+    answered and applied at the start of the next one. Each rebuild only feeds the
+    previous summary plus the newly evicted turns to the model, so cost does not
+    grow with session length. Source URLs from exa_search/live_search results are
+    extracted verbatim so they survive compaction even if the model omits them.
+    """
+
+    keep_recent = 15           # Non-system messages kept verbatim
+    trigger_length = 20        # Compact once the history grows past this many messages
+    hard_limit = 60            # Block on a pending summary past this many non-system messages
+    summary_timeout = 120.0    # Seconds; a hung summary request must not hold up exit
+    summary_max_tokens = 800
+    max_sources = 40
+    max_chars_per_message = 4000
+
+    def __init__(self):
+        self.summary = ""
+        self.sources: List[str] = []
+        self.message: Optional[Dict[str, Any]] = None
+        self.pending: Optional[Future] = None
+        self.pending_evicted: List[Any] = []
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kimi-compactor")
+
+    def reset(self):
+        self.summary = ""
+        self.sources = []
+        self.message = None
+        self.pending = None
+        self.pending_evicted = []
+
+    def _evictable(self) -> List[Any]:
+        """Return the oldest non-system messages outside the recent window, cut at a user turn."""
+        others = [msg for msg in conversation_history if message_field(msg, "role") != "system"]
+        if len(others) <= self.keep_recent:
+            return []
+        cut = len(others) - self.keep_recent
+        # Never split an assistant tool_calls message from its tool results
+        while cut > 0 and message_field(others[cut], "role") != "user":
+            cut -= 1
+        return others[:cut]
+
+    def maybe_compact(self):
+        if self.pending is not None and self.pending.done():
+            self._apply()
+        if len(conversation_history) <= self.trigger_length:
+            return
+        if self.pending is None:
+            evicted = self._evictable()
+            if evicted:
+                self.pending_evicted = evicted
+                self.pending = self.executor.submit(self._summarize, self.summary, evicted)
+        others = sum(1 for msg in conversation_history if message_field(msg, "role") != "system")
+        if self.pending is not None and (others > self.hard_limit or REPRODUCIBLE_RUN):
+            with console.status("[bold bright_magenta]🗜 Compacting conversation history...[/bold bright_magenta]"):
+                try:
+                    self.pending.result(timeout=self.summary_timeout)
+                except Exception:
+                    pass
+            self._apply()
+
+    def _apply(self):
+        future, evicted = self.pending, self.pending_evicted
+        self.pending, self.pending_evicted = None, []
+        try:
+            summary = future.result()
+            if not summary:
+                raise ValueError("empty summary")
+        except Exception as e:
+            # Keep the turns in the history; the next turn schedules the compaction again
+            console.print(f"[bold yellow]⚠[/bold yellow] History summarization failed, older turns kept for now: {e}")
+            return
+        self.summary = summary
+        self._collect_sources(evicted)
+        for msg in evicted:
+            if message_field(msg, "role") == "tool":
+                seen_content.forget_results(self._tool_text(msg))
+        evicted_ids = {id(msg) for msg in evicted}
+        conversation_history[:] = [msg for msg in conversation_history if id(msg) not in evicted_ids]
+        self._write_message()
+
+    def _collect_sources(self, messages: List[Any]):
+        for msg in messages:
+            if message_field(msg, "role") != "tool" or message_field(msg, "name") not in ("exa_search", "live_search"):
+                continue
+            text = self._tool_text(msg)
+            for title, url in re.findall(r"Title: (.*)\nURL: (https?://\S+)", text):
+                entry = f"- {title.strip()} <{url}>"
+                if entry not in self.sources:
+                    self.sources.append(entry)
+        self.sources = self.sources[-self.max_sources:]
+
+    def _write_message(self):
+        content = "Summary of earlier conversation (older turns were compacted):\n\n"
+        content += self.summary or "(no summary available)"
+        if self.sources:
+            content += "\n\nSources gathered earlier in this session:\n" + "\n".join(self.sources)
+        if self.message is not None and any(msg is self.message for msg in conversation_history):
+            self.message["content"] = content
+            return
+        self.message = {"role": "system", "content": content}
+        # Place the summary right after the main system prompt
+        conversation_history.insert(1 if conversation_history else 0, self.message)
+
+    @staticmethod
+    def _tool_text(msg: Any) -> str:
+        content = message_field(msg, "content") or ""
+        try:
+            payload = json.loads(content)
+            return str(payload.get("result", payload.get("error", "")))
+        except (ValueError, AttributeError):
+            return content
+
+    def _render(self, messages: List[Any]) -> str:
+        lines = []
+        for msg in messages:
+            role = message_field(msg, "role")
+            if role == "tool":
+                text = f"[{message_field(msg, 'name')} result] {self._tool_text(msg)}"
+            else:
+                text = message_field(msg, "content") or ""
+                for tool_call in message_field(msg, "tool_calls") or []:
+                    function = message_field(tool_call, "function")
+                    text += f"\n[called {message_field(function, 'name')}({message_field(function, 'arguments')})]"
+            lines.append(f"{role.upper()}: {text[:self.max_chars_per_message]}")
+        return "\n\n".join(lines)
+
+    def _summarize(self, previous_summary: str, messages: List[Any]) -> str:
+        prompt = dedent(f"""
+        Update the running summary of a research assistant session with the new transcript below.
+        Keep every concrete fact, number, name and conclusion that may matter later, and keep the
+        URL of each source next to the facts taken from it. Drop greetings and repetition.
+        Answer with the updated summary only, at most {self.summary_max_tokens} tokens.
+
+        CURRENT SUMMARY:
+        {{summary}}
+
+        NEW TRANSCRIPT:
+        {{transcript}}
+        """).format(summary=previous_summary or "(empty)", transcript=self._render(messages))
+        completion = client.chat.completions.create(
+            model="moonshotai/kimi-k2",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=self.summary_max_tokens,
+            timeout=self.summary_timeout,
+            extra_headers={
+                "HTTP-Referer": "https://github.com/kingj/kimi-possible",
+                "X-Title": "Kimi Possible",
+            },
+        )
+        summary = (completion.choices[0].message.content or "").strip()
+        # Rough 4 chars/token bound in case the provider ignores max_tokens
+        return summary[:self.summary_max_tokens * 4]
+
+compactor = ConversationCompactor()
+
 def trim_conversation_history():
-    """Trim conversation history to prevent token limit issues while preserving tool call sequences"""
-    if len(conversation_history) <= 20:  # Don't trim if conversation is still small
-        return
-        
-    # Always keep the system prompt
-    system_msgs = [msg for msg in conversation_history if msg["role"] == "system"]
-    other_msgs = [msg for msg in conversation_history if msg["role"] != "system"]
-    
-    # Keep only the last 15 messages to prevent token overflow
-    if len(other_msgs) > 15:
-        other_msgs = other_msgs[-15:]
-    
-    # Rebuild conversation history
-    conversation_history.clear()
-    conversation_history.extend(system_msgs + other_msgs)
+    """Compact older turns into the running summary to prevent token limit issues while preserving tool call sequences"""
+    compactor.maybe_compact()
+
+# Counters for the most recent turn, reported by --bench
+turn_stats: Dict[str, int] = {}
+
+turn_stats_lock = threading.Lock()
+
+def bump_turn_stat(name: str, amount: int = 1):
+    # Sub-agents update the counters from several threads
+    with turn_stats_lock:
+        turn_stats[name] = turn_stats.get(name, 0) + amount
+
+def record_completion_usage(completion):
+    usage = getattr(completion, "usage", None)
+    bump_turn_stat("completions")
+    if usage is not None:
+        bump_turn_stat("prompt_tokens", usage.prompt_tokens or 0)
+        bump_turn_stat("completion_tokens", usage.completion_tokens or 0)
+
+class CompletionCache:
+    """Opt-in on-disk cache of chat completions keyed on the full request.
+
+    The key is a hash of the canonicalized messages, tools, model and sampling
+    parameters, so any change to the conversation prefix is a miss. Entries are
+    evicted least-recently-used once the store exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 200_000_000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def make_key(**request: Any) -> str:
+        request["messages"] = [
+            msg if isinstance(msg, dict) else msg.model_dump(exclude_none=True)
+            for msg in request["messages"]
+        ]
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        with self.lock:
+            row = self.db.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key: str, completion: ChatCompletion):
+        value = completion.model_dump_json()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall():
+            self.db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
 
-def kimi_chat_with_tools(user_message: str):
+# Set in main() when --cache is given
+completion_cache: Optional[CompletionCache] = None
+
+# Stream completions so tool calls can start before the message ends (--no-stream turns this off)
+STREAM_COMPLETIONS = True
+
+# Set for --record/--replay/--bench: no early tool starts and no background compaction, so request
+# bodies (result numbers, history shape) do not depend on timing and replay can match them exactly
+REPRODUCIBLE_RUN = False
+
+class PipelinedToolExecutor:
+    """Start side-effect-free tool calls as soon as their streamed arguments are complete JSON.
+
+    Calls that change state still wait for the finished assistant message, as
+    does any call emitted after one of them, and results are always collected
+    in the order the model emitted the calls.
+    """
+
+    def __init__(self, turn_deadline: Optional[float] = None):
+        self.turn_deadline = turn_deadline
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="kimi-pipeline")
+        self.started: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _side_effect_free(name: str) -> bool:
+        spec = tool_registry.get(name)
+        return spec is not None and spec.side_effect_free
+
+    def on_tool_arguments(self, index: int, calls: Dict[int, Dict[str, Any]]):
+        """Consider starting calls[index]; calls holds every call streamed so far, keyed by position."""
+        if REPRODUCIBLE_RUN:
+            return
+        entry = calls[index]
+        tool_call_id, name, arguments_text = entry["id"], entry["name"], entry["arguments"]
+        if not tool_call_id or tool_call_id in self.started:
+            return
+        if not self._side_effect_free(name):
+            return
+        # An earlier call that may change state has to run first
+        if any(i not in calls or not self._side_effect_free(calls[i]["name"]) for i in range(index)):
+            return
+        try:
+            arguments = json.loads(arguments_text)
+        except ValueError:
+            return  # Still streaming
+        console.print(f"[dim]Debug: Starting {name} while the response streams[/dim]")
+        future = self.executor.submit(run_tool, name, arguments, self.turn_deadline)
+        self.started[tool_call_id] = (arguments_text, future)
+
+    def run(self, tool_call_id: str, name: str, arguments_text: str) -> str:
+        """Return the result of a tool call, reusing the early start when the arguments match."""
+        started = self.started.pop(tool_call_id, None)
+        if started is not None:
+            if started[0] == arguments_text:
+                return started[1].result()
+            # Let the stale call finish and be forgotten first, or the re-run may be marked as repeating it
+            wait_futures([started[1]])
+            self._discard(started[1])
+        return run_tool(name, json.loads(arguments_text), self.turn_deadline)
+
+    @staticmethod
+    def _discard(future):
+        # Hits from a result the model never sees must not mark later results as repeats
+        def forget(done):
+            if not done.cancelled() and done.exception() is None:
+                seen_content.forget_results(str(done.result()))
+        future.add_done_callback(forget)
+
+    def shutdown(self):
+        for _, future in self.started.values():
+            self._discard(future)
+        self.started.clear()
+        self.executor.shutdown(wait=False)
+
+def stream_completion(request: Dict[str, Any], timeout: Optional[float], on_tool_arguments=None) -> ChatCompletion:
+    """Stream a completion, reporting tool call arguments as they grow, and assemble the final ChatCompletion."""
+    stream = client.chat.completions.create(
+        **request,
+        stream=True,
+        stream_options={"include_usage": True},
+        timeout=timeout,
+        extra_headers={
+            "HTTP-Referer": "https://github.com/kingj/kimi-possible",
+            "X-Title": "Kimi Possible",
+        },
+    )
+    completion_id, created, model = None, int(time.time()), request["model"]
+    content_parts: List[str] = []
+    calls: Dict[int, Dict[str, Any]] = {}
+    finish_reason = None
+    usage = None
+    for chunk in stream:
+        completion_id = completion_id or chunk.id
+        created = chunk.created or created
+        model = chunk.model or model
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta is not None and delta.content:
+            content_parts.append(delta.content)
+        for tool_call in (delta.tool_calls if delta is not None else None) or []:
+            index = tool_call.index if tool_call.index is not None else max(len(calls) - (0 if tool_call.id else 1), 0)
+            entry = calls.setdefault(index, {"id": None, "name": "", "arguments": ""})
+            if tool_call.id:
+                entry["id"] = tool_call.id
+            if tool_call.function is not None:
+                entry["name"] += tool_call.function.name or ""
+                entry["arguments"] += tool_call.function.arguments or ""
+                # Only try to parse when the arguments could have just closed
+                if on_tool_arguments and entry["arguments"].rstrip().endswith("}"):
+                    on_tool_arguments(index, calls)
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+
+    if finish_reason not in ("stop", "length", "tool_calls", "content_filter", "function_call"):
+        finish_reason = "tool_calls" if calls else "stop"
+    message: Dict[str, Any] = {"role": "assistant", "content": "".join(content_parts) or None}
+    if calls:
+        message["tool_calls"] = [
+            {"id": entry["id"], "type": "function", "function": {"name": entry["name"], "arguments": entry["arguments"]}}
+            for _, entry in sorted(calls.items())
+        ]
+    return ChatCompletion.model_validate({
+        "id": completion_id or "stream",
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+        "usage": usage.model_dump() if usage is not None else None,
+    })
+
+def create_completion(messages: List[Any], use_cache: bool = True, timeout: Optional[float] = None,
+                      on_tool_arguments=None, tool_schemas: Optional[List[Dict[str, Any]]] = None,
+                      tool_choice: Optional[str] = None):
+    """Create a Kimi chat completion, served from the completion cache when enabled."""
+    request = {
+        "model": "moonshotai/kimi-k2",
+        "messages": messages,
+        "temperature": 0.3,
+        "tools": tools if tool_schemas is None else tool_schemas,
+    }
+    if tool_choice is not None:
+        request["tool_choice"] = tool_choice
+    key = None
+    if completion_cache is not None and use_cache:
+        key = CompletionCache.make_key(**request)
+        cached = completion_cache.get(key)
+        if cached is not None:
+            console.print("[dim]Debug: Completion served from cache[/dim]")
+            bump_turn_stat("cache_hits")
+            return cached
+    if STREAM_COMPLETIONS:
+        completion = stream_completion(request, timeout, on_tool_arguments)
+    else:
+        completion = client.chat.completions.create(
+            **request,
+            timeout=timeout,
+            extra_headers={
+                "HTTP-Referer": "https://github.com/kingj/kimi-possible",
+                "X-Title": "Kimi Possible",
+            },
+        )
+    record_completion_usage(completion)
+    if key is not None and completion.choices and completion.choices[0].finish_reason in ("stop", "tool_calls"):
+        completion_cache.put(key, completion)
+    return completion
+
+def split_cache_bypass(user_input: str):
+    """Strip a leading /nocache from a request; returns (message, use_cache)."""
+    prefix = "/nocache "
+    if user_input.lower().startswith(prefix):
+        return user_input[len(prefix):].strip(), False
+    return user_input, True
+
+def kimi_chat_with_tools(user_message: str, use_cache: bool = True):
+    turn_stats.clear()
     # Add the user message to conversation history
     conversation_history.append({"role": "user", "content": user_message})
     
@@ -747,22 +2138,25 @@ def kimi_chat_with_tools(user_message: str):
     finish_reason = None
     max_iterations = 5
     iteration = 0
+    turn_deadline = time.monotonic() + TURN_TIME_BUDGET
     
     try:
         # Use Kimi's tool calling pattern
         while (finish_reason is None or finish_reason == "tool_calls") and iteration < max_iterations:
+            remaining = turn_deadline - time.monotonic()
+            if remaining <= 0:
+                console.print("[bold yellow]⚠ Turn time budget exhausted.[/bold yellow]")
+                return {"error": f"Turn exceeded its {TURN_TIME_BUDGET:.0f}s time budget"}
             iteration += 1
             console.print(f"[dim]Debug: Tool call iteration {iteration}[/dim]")
-            completion = client.chat.completions.create(
-                model="moonshotai/kimi-k2",
-                messages=conversation_history,
-                temperature=0.3,
-                tools=tools,
-                extra_headers={
-                    "HTTP-Referer": "https://github.com/kingj/kimi-possible",
-                    "X-Title": "Kimi Possible",
-                },
-            )
+            refresh_context_files()
+            pipeline = PipelinedToolExecutor(turn_deadline)
+            try:
+                completion = create_completion(conversation_history, use_cache=use_cache, timeout=remaining,
+                                               on_tool_arguments=pipeline.on_tool_arguments)
+            except BaseException:
+                pipeline.shutdown()
+                raise
             
             choice = completion.choices[0]
             finish_reason = choice.finish_reason
@@ -773,35 +2167,46 @@ def kimi_chat_with_tools(user_message: str):
                 conversation_history.append(choice.message)
                 
                 console.print(f"\n[bold bright_magenta]⚡ Executing {len(choice.message.tool_calls)} function call(s)...[/bold bright_magenta]")
+                bump_turn_stat("tool_calls", len(choice.message.tool_calls))
                 
                 # Execute each tool call
-                for tool_call in choice.message.tool_calls:
+                for index, tool_call in enumerate(choice.message.tool_calls):
                     tool_call_name = tool_call.function.name
-                    tool_call_arguments = json.loads(tool_call.function.arguments)
-                    
                     console.print(f"[bright_magenta]→ {tool_call_name}[/bright_magenta]")
-                    
+
                     try:
-                        tool_function = tool_map[tool_call_name]
-                        tool_result = tool_function(tool_call_arguments)
-                        
-                        # Add tool result to conversation
-                        conversation_history.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": tool_call_name,
-                            "content": json.dumps({"result": tool_result}),
-                        })
-                        
+                        if tool_call_name not in tool_registry:
+                            raise KeyError(f"Unknown tool '{tool_call_name}'")
+                        tool_result = pipeline.run(tool_call.id, tool_call_name, tool_call.function.arguments)
+                        content = {"result": tool_result}
+                    except ToolTimeout as e:
+                        console.print(f"[yellow]⏱ {e}[/yellow]")
+                        content = {"error": str(e), "error_type": "timeout", "tool": tool_call_name}
+                    except KeyboardInterrupt:
+                        # Close out every pending call so the history stays valid, then abandon the turn
+                        pipeline.shutdown()
+                        for pending in choice.message.tool_calls[index:]:
+                            conversation_history.append({
+                                "role": "tool",
+                                "tool_call_id": pending.id,
+                                "name": pending.function.name,
+                                "content": json.dumps({"error": "Cancelled by user", "error_type": "cancelled"}),
+                            })
+                        raise
                     except Exception as e:
                         console.print(f"[red]Error executing {tool_call_name}: {e}[/red]")
-                        conversation_history.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": tool_call_name,
-                            "content": json.dumps({"error": str(e)}),
-                        })
+                        content = {"error": str(e)}
+
+                    # Add tool result to conversation
+                    conversation_history.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "name": tool_call_name,
+                        "content": json.dumps(content),
+                    })
+                pipeline.shutdown()
             else:
+                pipeline.shutdown()
                 # Final response - display it
                 console.print(f"\n[bold bright_magenta]🕵️‍♀️ Kimi>[/bold bright_magenta] {choice.message.content}")
                 # Add final response to conversation history
@@ -813,17 +2218,384 @@ def kimi_chat_with_tools(user_message: str):
         
         return {"success": True}
         
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]⚠ Turn cancelled.[/bold yellow]")
+        return {"error": "Turn cancelled by user"}
     except Exception as e:
         error_msg = f"Kimi API error: {str(e)}"
         console.print(f"\n[bold red]❌ {error_msg}[/bold red]")
         return {"error": error_msg}
 
+# --------------------------------------------------------------------------------
+# 7.1. Record/replay harness for offline benchmarks
+# --------------------------------------------------------------------------------
+
+# Upstreams reachable through the local stand-in server, keyed by path prefix
+REPLAY_UPSTREAMS = {
+    "openrouter": "https://openrouter.ai",
+    "exa": "https://api.exa.ai",
+    "xai": "https://api.x.ai",
+}
+
+class Cassette:
+    """Recorded HTTP exchanges, stored as JSON without any request headers (no API keys)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.interactions: List[Dict[str, Any]] = []
+        self.used = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def request_key(service: str, method: str, path: str, body: bytes) -> str:
+        try:
+            canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            canonical = body
+        return hashlib.sha256(f"{service} {method} {path}\n".encode("utf-8") + canonical).hexdigest()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.interactions = json.load(f)["interactions"]
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "interactions": self.interactions}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, interaction: Dict[str, Any]):
+        with self.lock:
+            self.interactions.append(interaction)
+            self.save()  # Save as we go so an interrupted session still leaves a usable cassette
+
+    @staticmethod
+    def is_streamed(body: Any) -> bool:
+        try:
+            return bool(json.loads(body).get("stream"))
+        except (ValueError, AttributeError):
+            return False
+
+    def match(self, service: str, method: str, path: str, key: str, streamed: bool = False) -> Optional[Dict[str, Any]]:
+        """Return the first unused exchange with the same request, else the next unused one on the same
+        endpoint with the same streaming mode."""
+        with self.lock:
+            fallback = None
+            for i, interaction in enumerate(self.interactions):
+                if i in self.used:
+                    continue
+                if interaction["key"] == key:
+                    self.used.add(i)
+                    return interaction
+                if (fallback is None
+                        and (interaction["service"], interaction["method"], interaction["path"]) == (service, method, path)
+                        and self.is_streamed(interaction["request_body"]) == streamed):
+                    fallback = i
+            if fallback is not None:
+                self.used.add(fallback)
+                console.print(f"[bold yellow]⚠[/bold yellow] Replay: no exact match for {method} {service}{path}, "
+                              "serving the next recorded exchange; the run has diverged from the recording")
+                return self.interactions[fallback]
+            return None
+
+class ReplayLatency:
+    """Delay applied to replayed responses: none, the recorded latency, or a seeded synthetic distribution."""
+
+    def __init__(self, spec: str, seed: int = 0):
+        self.mode, _, params = spec.partition(":")
+        if self.mode not in ("none", "recorded", "synthetic"):
+            raise ValueError(f"Unknown replay latency '{spec}'")
+        values = [float(v) for v in params.split(":") if v] if params else []
+        self.mean_ms = values[0] if values else 500.0
+        self.jitter_ms = values[1] if len(values) > 1 else 0.0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, recorded_seconds: float) -> float:
+        if self.mode == "recorded":
+            return recorded_seconds
+        if self.mode == "synthetic":
+            with self.lock:
+                return max(self.rng.gauss(self.mean_ms, self.jitter_ms), 0.0) / 1000
+        return 0.0
+
+class StandInServer:
+    """Local HTTP server standing in for OpenRouter, Exa and x.ai.
+
+    In record mode requests are forwarded upstream and the exchanges written to
+    the cassette; in replay mode responses are served from the cassette.
+    """
+
+    def __init__(self, cassette: Cassette, replay: bool, latency: Optional[ReplayLatency] = None):
+        self.cassette = cassette
+        self.replay = replay
+        self.latency = latency or ReplayLatency("none")
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="kimi-stand-in", daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        service, _, path = request.path.lstrip("/").partition("/")
+        path = "/" + path
+        body = request.rfile.read(int(request.headers.get("Content-Length") or 0))
+        if service not in REPLAY_UPSTREAMS:
+            self._respond(request, 404, {"error": f"Unknown service '{service}'"})
+            return
+        key = Cassette.request_key(service, request.command, path, body)
+
+        if self.replay:
+            interaction = self.cassette.match(service, request.command, path, key, Cassette.is_streamed(body))
+            if interaction is None:
+                self._respond(request, 404, {"error": f"No recorded interaction for {request.command} {service}{path}"})
+                return
+            time.sleep(self.latency.delay(interaction["latency"]))
+            self._respond(request, interaction["status"], interaction["response_body"], interaction["content_type"])
+            return
+
+        headers = {k: v for k, v in request.headers.items()
+                   if k.lower() not in ("host", "content-length", "accept-encoding", "connection")}
+        started = time.monotonic()
+        try:
+            response = requests.request(request.command, REPLAY_UPSTREAMS[service] + path,
+                                        headers=headers, data=body, timeout=300)
+        except requests.exceptions.RequestException as e:
+            self._respond(request, 502, {"error": f"Upstream request failed: {e}"})
+            return
+        content_type = response.headers.get("Content-Type", "application/json")
+        self.cassette.add({
+            "service": service,
+            "method": request.command,
+            "path": path,
+            "key": key,
+            "request_body": body.decode("utf-8", errors="replace"),
+            "status": response.status_code,
+            "content_type": content_type,
+            "response_body": response.text,
+            "latency": round(time.monotonic() - started, 4),
+        })
+        self._respond(request, response.status_code, response.text, content_type)
+
+    @staticmethod
+    def _respond(request: BaseHTTPRequestHandler, status: int, body: Any, content_type: str = "application/json"):
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+def configure_endpoints(base_url: str, placeholder_keys: bool = False):
+    """Point the OpenRouter, Exa and x.ai clients at the stand-in server."""
+    global XAI_SEARCH_URL
+    if placeholder_keys:
+        # Replay never reaches the real APIs, so any key will do for the ones that are unset
+        for name in ("OPENROUTER_API_KEY", "EXA_API_KEY", "X_API_KEY"):
+            os.environ.setdefault(name, "replay")
+    configure_clients(base_url)
+    XAI_SEARCH_URL = f"{base_url}/xai/v1/search"
+
+def start_record_replay(args) -> Optional[StandInServer]:
+    if not (args.record or args.replay):
+        return None
+    if args.replay:
+        cassette = Cassette(args.replay)
+        cassette.load()
+        server = StandInServer(cassette, replay=True, latency=ReplayLatency(args.replay_latency, args.replay_seed))
+        console.print(f"[bold magenta]▶[/bold magenta] Replaying {len(cassette.interactions)} recorded exchanges from '[bright_cyan]{args.replay}[/bright_cyan]'")
+    else:
+        server = StandInServer(Cassette(args.record), replay=False)
+        console.print(f"[bold magenta]⏺[/bold magenta] Recording exchanges to '[bright_cyan]{args.record}[/bright_cyan]'")
+    server.start()
+    configure_endpoints(server.base_url, placeholder_keys=bool(args.replay))
+    return server
+
+def run_benchmark(prompts_path: str):
+    """Run each prompt as a turn and report wall-clock time and token usage."""
+    with open(prompts_path, "r", encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+
+    rows = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        response_data = answer_request(prompt)
+        elapsed = time.perf_counter() - started
+        rows.append((prompt, elapsed, dict(turn_stats), response_data.get("error")))
+
+    table = Table(title="⏱ Benchmark", show_header=True, header_style="bold bright_magenta", border_style="magenta")
+    table.add_column("Prompt", style="bright_cyan", max_width=40)
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Completions", justify="right")
+    table.add_column("Cache hits", justify="right")
+    table.add_column("Tool calls", justify="right")
+    table.add_column("Prompt tokens", justify="right")
+    table.add_column("Completion tokens", justify="right")
+    table.add_column("Error", style="red")
+    for prompt, elapsed, stats, error in rows:
+        table.add_row(prompt, f"{elapsed:.3f}", str(stats.get("completions", 0)), str(stats.get("cache_hits", 0)),
+                      str(stats.get("tool_calls", 0)),
+                      str(stats.get("prompt_tokens", 0)), str(stats.get("completion_tokens", 0)), error or "")
+    console.print(table)
+
+    if rows:
+        times = sorted(elapsed for _, elapsed, _, _ in rows)
+        p95 = times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))]
+        total_prompt = sum(stats.get("prompt_tokens", 0) for _, _, stats, _ in rows)
+        total_completion = sum(stats.get("completion_tokens", 0) for _, _, stats, _ in rows)
+        console.print(f"[bold bright_magenta]Turns:[/bold bright_magenta] {len(rows)}  "
+                      f"[bold bright_magenta]Total:[/bold bright_magenta] {sum(times):.3f}s  "
+                      f"[bold bright_magenta]p50:[/bold bright_magenta] {statistics.median(times):.3f}s  "
+                      f"[bold bright_magenta]p95:[/bold bright_magenta] {p95:.3f}s  "
+                      f"[bold bright_magenta]Tokens:[/bold bright_magenta] {total_prompt} prompt / {total_completion} completion")
+
+# --------------------------------------------------------------------------------
+# 7.2. Parallel sub-agent fan-out over research targets
+# --------------------------------------------------------------------------------
+
+SUB_AGENT_TOOLS = {"exa_search", "live_search", "fetch_result"}  # Read-only, so sub-agents can run concurrently
+SUB_AGENT_MAX_ITERATIONS = 3
+SUB_AGENT_MAX_FINDINGS_CHARS = 3000
+FAN_OUT_CONCURRENCY = 3
+
+def get_sub_agent_prompt(domain: str, target: str) -> str:
+    return dedent(f"""
+    You are a research sub-agent of Kimi Possible working on one research target: {target}.
+    Domain: {domain.replace('_', ' ')}.
+
+    Use exa_search and live_search to research the user's request from the angle of this target only.
+    Batch related queries into a single call and keep to a few tool calls.
+
+    When done, reply with condensed findings only: at most 250 words of bullet points with concrete
+    facts, figures and opinions, each followed by its source URL. No introduction or conclusion.
+    """)
+
+def run_sub_agent(target: str, user_message: str, deadline: float, use_cache: bool = True,
+                  cancel: Optional[threading.Event] = None) -> str:
+    """Research one target in an isolated context and return its condensed findings."""
+    messages: List[Any] = [
+        {"role": "system", "content": get_sub_agent_prompt(kimi_config.domain, target)},
+        {"role": "user", "content": user_message},
+    ]
+    schemas = [tool for tool in tools if tool["function"]["name"] in SUB_AGENT_TOOLS]
+    seen = SeenContentIndex()
+    for iteration in range(SUB_AGENT_MAX_ITERATIONS):
+        if cancel is not None and cancel.is_set():
+            return "(no findings: cancelled)"
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "(no findings: time budget exhausted)"
+        # Tools are withheld on the last iteration so the sub-agent has to report back
+        last = iteration == SUB_AGENT_MAX_ITERATIONS - 1
+        if last:
+            messages.append({"role": "system", "content": "Stop searching and report your condensed findings now."})
+        completion = create_completion(messages, use_cache=use_cache, timeout=remaining,
+                                       tool_schemas=schemas, tool_choice="none" if last else None)
+        choice = completion.choices[0]
+        messages.append(choice.message)
+        if choice.finish_reason != "tool_calls" or not choice.message.tool_calls:
+            return (choice.message.content or "").strip()[:SUB_AGENT_MAX_FINDINGS_CHARS]
+        bump_turn_stat("tool_calls", len(choice.message.tool_calls))
+        for tool_call in choice.message.tool_calls:
+            name = tool_call.function.name
+            console.print(f"[dim]  [{target}] → {name}[/dim]")
+            try:
+                if name not in SUB_AGENT_TOOLS:
+                    raise KeyError(f"Tool '{name}' is not available to research sub-agents")
+                content = {"result": run_tool(name, json.loads(tool_call.function.arguments), deadline, seen)}
+            except ToolTimeout as e:
+                content = {"error": str(e), "error_type": "timeout", "tool": name}
+            except Exception as e:
+                content = {"error": str(e)}
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "name": name,
+                "content": json.dumps(content),
+            })
+    return "(no findings reported)"
+
+def fan_out_research(user_message: str, use_cache: bool = True):
+    """Run one sub-agent per research target concurrently, then merge their findings in the main conversation."""
+    targets = kimi_config.research_targets
+    turn_stats.clear()
+    deadline = time.monotonic() + TURN_TIME_BUDGET
+    console.print(f"\n[bold bright_magenta]🔀 Fanning out to {len(targets)} research sub-agents "
+                  f"(up to {FAN_OUT_CONCURRENCY} at a time)...[/bold bright_magenta]")
+
+    findings: Dict[str, str] = {}
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(FAN_OUT_CONCURRENCY, 1), thread_name_prefix="kimi-sub-agent")
+    futures = {target: executor.submit(run_sub_agent, target, user_message, deadline, use_cache, cancel)
+               for target in targets}
+    try:
+        for target, future in futures.items():
+            try:
+                findings[target] = future.result(timeout=max(deadline - time.monotonic(), 0))
+                console.print(f"[bold magenta]✓[/bold magenta] [bright_cyan]{target}[/bright_cyan]")
+            except FutureTimeoutError:
+                findings[target] = "(no findings: time budget exhausted)"
+                console.print(f"[yellow]⏱ {target}: timed out[/yellow]")
+            except Exception as e:
+                findings[target] = f"(no findings: {e})"
+                console.print(f"[red]✗ {target}: {e}[/red]")
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]⚠ Fan-out cancelled.[/bold yellow]")
+        return {"error": "Turn cancelled by user"}
+    finally:
+        # Queued sub-agents never start and running ones stop at their next iteration
+        cancel.set()
+        for future in futures.values():
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    sections = "\n\n".join(f"### {target}\n{text}" for target, text in findings.items())
+    # The findings ride in this turn's user message so the compactor can evict them with the turn
+    merge_request = (f"{user_message}\n\nCondensed findings from parallel research sub-agents, one per research "
+                     "target. Merge them into a single answer, keeping the source URLs; only search again to fill "
+                     f"a clear gap.\n\n{sections}")
+    stats = dict(turn_stats)
+    response_data = kimi_chat_with_tools(merge_request, use_cache=use_cache)
+    # kimi_chat_with_tools resets the counters; fold the sub-agent work back in for --bench
+    for name, value in stats.items():
+        bump_turn_stat(name, value)
+    return response_data
+
+def answer_request(user_input: str):
+    """Route a user request to the normal agent loop or to the research fan-out."""
+    message, use_cache = split_cache_bypass(user_input)
+    fan_out = kimi_config.fan_out
+    if message.lower().startswith("/fanout "):
+        message, fan_out = message[len("/fanout "):].strip(), True
+    if fan_out and kimi_config.research_targets:
+        return fan_out_research(message, use_cache=use_cache)
+    return kimi_chat_with_tools(message, use_cache=use_cache)
+
 # --------------------------------------------------------------------------------
 # 8. Main interactive loop
 # --------------------------------------------------------------------------------
 
 def main():
-    global kimi_config
+    global kimi_config, completion_cache, STREAM_COMPLETIONS, FAN_OUT_CONCURRENCY, REPRODUCIBLE_RUN
     
     # Parse command line arguments
     args = parse_args()
@@ -836,6 +2608,37 @@ def main():
     
     # Initialize conversation with the configured system prompt
     initialize_conversation()
+
+    if args.no_stream:
+        STREAM_COMPLETIONS = False
+    if args.record or args.replay or args.bench:
+        REPRODUCIBLE_RUN = True
+    if args.fan_out:
+        kimi_config.fan_out = True
+    FAN_OUT_CONCURRENCY = max(args.fan_out_concurrency, 1)
+
+    if args.cache:
+        try:
+            completion_cache = CompletionCache(args.cache, args.cache_max_mb * 1_000_000)
+        except (OSError, sqlite3.Error) as e:
+            console.print(f"[bold yellow]⚠[/bold yellow] Completion cache disabled: {e}")
+
+    # Route API traffic through the record/replay stand-in server if requested
+    try:
+        stand_in_server = start_record_replay(args)
+    except (OSError, ValueError, KeyError) as e:
+        console.print(f"[bold red]Error setting up record/replay: {e}[/bold red]")
+        return
+    if stand_in_server is None:
+        configure_clients()
+
+    if args.bench:
+        try:
+            run_benchmark(args.bench)
+        finally:
+            if stand_in_server:
+                stand_in_server.stop()
+        return
     
     # Create a beautiful gradient-style welcome panel
     domain_display = kimi_config.domain.replace('_', ' ').title()
@@ -865,6 +2668,8 @@ def main():
   • [dim]Optimized for {domain_display.lower()} tasks and research[/dim]{targets_display}
 
 [bold bright_magenta]⚙️ Commands:[/bold bright_magenta]
+  • [bright_cyan]/nocache your request[/bright_cyan] - Skip the completion cache for one request
+  • [bright_cyan]/fanout your request[/bright_cyan] - Research each target with its own sub-agent, then merge
   • [bright_cyan]exit[/bright_cyan] or [bright_cyan]quit[/bright_cyan] - End the session
   • Just ask naturally - the AI will handle operations automatically!"""
     
@@ -894,7 +2699,7 @@ def main():
         if try_handle_add_command(user_input):
             continue
 
-        response_data = kimi_chat_with_tools(user_input)
+        response_data = answer_request(user_input)
         
         if response_data.get("error"):
             console.print(f"[bold red]❌ Error: {response_data['error']}[/bold red]")